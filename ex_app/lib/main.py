@@ -1,10 +1,18 @@
+import logging
 import os
+import re
 import typing
 from pathlib import Path
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from http.cookiejar import DefaultCookiePolicy
 
 import httpx
-from starlette.responses import Response, FileResponse
+from starlette.background import BackgroundTask
+from starlette.exceptions import HTTPException
+from starlette.responses import Response, StreamingResponse
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
 from fastapi import FastAPI, responses, Request, Depends, BackgroundTasks, status
 from starlette.middleware.base import BaseHTTPMiddleware
 
@@ -19,9 +27,26 @@ from contextvars import ContextVar
 
 from gettext import translation
 
-LOCALE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "locale")
+LOGGER = logging.getLogger("vix")
+PROXY_HOP_BY_HOP_HEADERS = frozenset({b"connection", b"keep-alive", b"proxy-connection", b"te", b"trailer", b"upgrade"})
+# "transfer-encoding" is kept on requests: httpx re-frames the streamed body itself.
+PROXY_DROP_REQUEST_HEADERS = PROXY_HOP_BY_HOP_HEADERS | {b"host"}
+PROXY_DROP_RESPONSE_HEADERS = PROXY_HOP_BY_HOP_HEADERS | {b"transfer-encoding"}
+EX_APP_DIR = Path(__file__).resolve().parent.parent
+CLIENT_DIR = EX_APP_DIR.parent.joinpath("Visionatrix/visionatrix/client")
+STATIC_BAD_PATH = re.compile(r"^/|(^|/)\.\.(/|$)|\x00")
+STATIC_MAX_PATH = 4096
+APP_ID = os.getenv("APP_ID")
+LOCALE_DIR = EX_APP_DIR.joinpath("locale")
 current_translator = ContextVar("current_translator")
-current_translator.set(translation(os.getenv("APP_ID"), LOCALE_DIR, languages=["en"], fallback=True))
+
+
+@lru_cache(maxsize=64)
+def _get_translator(lang: str):
+    return translation(APP_ID, LOCALE_DIR, languages=[lang], fallback=True)
+
+
+current_translator.set(_get_translator("en"))
 
 
 def _(text):
@@ -30,25 +55,40 @@ def _(text):
 
 class LocalizationMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        request_lang = request.headers.get('Accept-Language', 'en')
-        print(f"DEBUG: lang={request_lang}")
-        translator = translation(
-            os.getenv("APP_ID"), LOCALE_DIR, languages=[request_lang], fallback=True
-        )
-        current_translator.set(translator)
+        current_translator.set(_get_translator(request.headers.get("Accept-Language", "en")))
         response = await call_next(request)
         return response
 
 
 @asynccontextmanager
-async def lifespan(_app: FastAPI):
+async def lifespan(app: FastAPI):
     print(_("Vix"))
+    # When VIX_UDS is set the backend is reached over that UNIX socket and the host in `base_url` is ignored.
+    # VIX_HTTP2=1 talks cleartext HTTP/2 (h2c, prior knowledge) and needs a backend that supports it.
+    http2 = os.getenv("VIX_HTTP2", "0").lower() in ("1", "true")
+    transport = httpx.AsyncHTTPTransport(
+        uds=os.getenv("VIX_UDS"),
+        http1=not http2,
+        http2=http2,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    )
+    app.state.http_client = httpx.AsyncClient(
+        transport=transport,
+        base_url="http://127.0.0.1:8288",
+        timeout=httpx.Timeout(30.0),
+        # Bodies are forwarded undecoded, so only the client's own "accept-encoding" may enable compression.
+        headers={"accept-encoding": "identity"},
+    )
+    # The client is shared by all users: never store backend cookies, the inbound "cookie" header is forwarded as is.
+    app.state.http_client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
     yield
+    await app.state.http_client.aclose()
 
 
 APP = FastAPI(lifespan=lifespan)
 APP.add_middleware(AppAPIAuthMiddleware)
-# APP.add_middleware(LocalizationMiddleware)
+if os.getenv("VIX_I18N", "0").lower() in ("1", "true"):
+    APP.add_middleware(LocalizationMiddleware)
 
 
 def enabled_handler(enabled: bool, nc: NextcloudApp) -> str:
@@ -62,15 +102,23 @@ def enabled_handler(enabled: bool, nc: NextcloudApp) -> str:
     return ""
 
 
-@APP.get("/heartbeat")
-async def heartbeat_callback():
-    return responses.JSONResponse(content={"status": "ok"})
+HEARTBEAT_RESPONSE = Response(content=b'{"status":"ok"}', media_type="application/json")
+
+
+async def heartbeat_callback(_request: Request):
+    return HEARTBEAT_RESPONSE
+
+
+# Plain Starlette route: no FastAPI dependency resolution or JSON encoding on every AppAPI probe.
+# AppAPIAuthMiddleware already skips authentication for "/heartbeat".
+APP.router.add_route("/heartbeat", heartbeat_callback, methods=["GET"])
 
 
 @APP.post("/init")
 async def init_callback(b_tasks: BackgroundTasks, nc: typing.Annotated[NextcloudApp, Depends(nc_app)]):
     b_tasks.add_task(fetch_models_task, nc, {}, 0)
-    return responses.JSONResponse(content={})
+    # A new Response is needed each time: FastAPI attaches `b_tasks` to the returned response object.
+    return Response(content=b"{}", media_type="application/json")
 
 
 @APP.put("/enabled")
@@ -80,52 +128,59 @@ def enabled_callback(enabled: bool, nc: typing.Annotated[NextcloudApp, Depends(n
 
 @APP.api_route("/api/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH", "TRACE"])
 async def proxy_backend_requests(request: Request, path: str):
-    # print(f"proxy_BACKEND_requests: {path} - {request.method}\nCookies: {request.cookies}", flush=True)
-    async with httpx.AsyncClient() as client:
-        url = f"http://127.0.0.1:8288/api/{path}"
-        headers = {key: value for key, value in request.headers.items() if key.lower() not in ("host", 'cookie')}
-        # print(f"proxy_BACKEND_requests: method={request.method}, path={path}, status={response.status_code}")
-        if request.method == "GET":
-            response = await client.get(
-                url,
-                params=request.query_params,
-                cookies=request.cookies,
-                headers=headers,
-            )
-        else:
-            response = await client.request(
-                method=request.method,
-                url=url,
-                params=request.query_params,
-                headers=headers,
-                cookies=request.cookies,
-                content=await request.body(),
-            )
-        # print(
-        #     f"proxy_BACKEND_requests: method={request.method}, path={path}, status={response.status_code}", flush=True
-        # )
-        response_header = dict(response.headers)
-        response_header.pop("transfer-encoding", None)
-        return Response(content=response.content, status_code=response.status_code, headers=response_header)
-
-
-@APP.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH", "TRACE"])
-async def proxy_requests(_request: Request, path: str):
-    print(f"proxy_requests: {path} - {_request.method}\nCookies: {_request.cookies}", flush=True)
-    if path.startswith("ex_app"):
-        file_server_path = Path("../../" + path)
-    elif not path:
-        file_server_path = Path("../../Visionatrix/visionatrix/client/index.html")
-    else:
-        file_server_path = Path("../../Visionatrix/visionatrix/client/" + path)
-    if not file_server_path.exists():
-        return Response(status_code=status.HTTP_404_NOT_FOUND)
-    response = FileResponse(str(file_server_path))
-    response.headers["content-security-policy"] = "default-src * 'unsafe-inline' 'unsafe-eval' data: blob:;"
-    print("proxy_FRONTEND_requests: <OK> Returning: ", str(file_server_path), flush=True)
-    return response
+    client: httpx.AsyncClient = request.app.state.http_client
+    url = f"/api/{path}"
+    # ASGI header names are already lowercased bytes, so they can be matched without decoding.
+    headers = [(key, value) for key, value in request.headers.raw if key not in PROXY_DROP_REQUEST_HEADERS]
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    backend_request = client.build_request(
+        method=request.method,
+        url=url,
+        params=request.query_params,
+        headers=headers,
+        content=request.stream() if has_body else None,
+    )
+    response = await client.send(backend_request, stream=True)
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("proxy_backend_requests: %s %s -> %s", request.method, path, response.status_code)
+    proxy_response = StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        background=BackgroundTask(response.aclose),
+    )
+    # Forward backend headers as bytes; this also keeps repeated headers such as "set-cookie" separate.
+    proxy_response.raw_headers = [
+        (name, value) for key, value in response.headers.raw if (name := key.lower()) not in PROXY_DROP_RESPONSE_HEADERS
+    ]
+    return proxy_response
+
+
+class FrontendStaticFiles(StaticFiles):
+    async def check_config(self) -> None:
+        # A missing directory is not an error: its files are simply not found.
+        if self.directory is None or Path(self.directory).is_dir():
+            await super().check_config()
+
+    async def get_response(self, path: str, scope: Scope):
+        if len(path) > STATIC_MAX_PATH or STATIC_BAD_PATH.search(path):
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        try:
+            response = await super().get_response(path, scope)
+        except HTTPException as e:
+            if e.status_code != status.HTTP_404_NOT_FOUND:
+                raise
+            return Response(status_code=status.HTTP_404_NOT_FOUND)
+        response.headers["content-security-policy"] = "default-src * 'unsafe-inline' 'unsafe-eval' data: blob:;"
+        return response
+
+
+# These mounts must stay last: "/" matches every path and StaticFiles itself only allows GET and HEAD.
+# The frontend client may be missing in development setups: directories are not checked at import time and
+# FrontendStaticFiles answers 404 for every path under a missing directory.
+APP.mount("/ex_app", FrontendStaticFiles(directory=EX_APP_DIR, check_dir=False))
+APP.mount("/", FrontendStaticFiles(directory=CLIENT_DIR, html=True, check_dir=False))
 
 
 if __name__ == "__main__":
     os.chdir(Path(__file__).parent)
-    run_app("main:APP", log_level="trace")
+    run_app("main:APP", log_level="info")
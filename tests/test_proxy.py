@@ -0,0 +1,137 @@
+import asyncio
+import gzip
+import sys
+from pathlib import Path
+
+import httpx
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath("ex_app/lib")))
+
+import main  # noqa: E402
+
+
+def _request(method: str, path: str, headers: list[tuple[bytes, bytes]], body: bytes = b"") -> Request:
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": f"/api/{path}",
+        "query_string": b"",
+        "headers": headers,
+        "app": main.APP,
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+async def _stream(*chunks: bytes):
+    # Bytes content would be read eagerly by httpx, and `aiter_raw()` needs an unconsumed stream.
+    for chunk in chunks:
+        yield chunk
+
+
+def test_backend_cookies_are_not_shared(monkeypatch):
+    seen_cookies = []
+
+    def backend(request: httpx.Request) -> httpx.Response:
+        seen_cookies.append(request.headers.get("cookie"))
+        return httpx.Response(200, headers={"set-cookie": "session=USER_A_SECRET; Path=/"})
+
+    monkeypatch.setattr(main.httpx, "AsyncHTTPTransport", lambda **_kwargs: httpx.MockTransport(backend))
+
+    async def run():
+        async with main.lifespan(main.APP):
+            for headers in ([(b"cookie", b"session=USER_B")], []):
+                response = await main.proxy_backend_requests(_request("GET", "login", headers), "login")
+                await response.background()
+
+    asyncio.run(run())
+    assert seen_cookies == ["session=USER_B", None]
+
+
+def test_backend_response_headers_are_forwarded(monkeypatch):
+    seen_accept_encoding = []
+    compressed_body = gzip.compress(b"body")
+
+    def backend(request: httpx.Request) -> httpx.Response:
+        seen_accept_encoding.append(request.headers.get("accept-encoding"))
+        headers = [
+            ("set-cookie", "a=1"),
+            ("set-cookie", "b=2"),
+            ("transfer-encoding", "chunked"),
+            ("connection", "close"),
+            ("content-encoding", "gzip"),
+        ]
+        return httpx.Response(200, headers=headers, content=_stream(compressed_body))
+
+    monkeypatch.setattr(main.httpx, "AsyncHTTPTransport", lambda **_kwargs: httpx.MockTransport(backend))
+
+    async def run():
+        async with main.lifespan(main.APP):
+            response = await main.proxy_backend_requests(_request("GET", "tasks", []), "tasks")
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            await response.background()
+            return response.raw_headers, body
+
+    raw_headers, body = asyncio.run(run())
+    assert [value for key, value in raw_headers if key == b"set-cookie"] == [b"a=1", b"b=2"]
+    assert not {b"transfer-encoding", b"connection"} & {key for key, _ in raw_headers}
+    assert (b"content-encoding", b"gzip") in raw_headers
+    assert body == compressed_body
+    assert seen_accept_encoding == ["identity"]
+
+
+def test_hop_by_hop_request_headers_are_not_forwarded(monkeypatch):
+    seen_headers = []
+
+    def backend(request: httpx.Request) -> httpx.Response:
+        seen_headers.append(request.headers)
+        return httpx.Response(204)
+
+    monkeypatch.setattr(main.httpx, "AsyncHTTPTransport", lambda **_kwargs: httpx.MockTransport(backend))
+
+    async def run():
+        async with main.lifespan(main.APP):
+            headers = [(b"connection", b"close"), (b"te", b"trailers"), (b"upgrade", b"h2c"), (b"x-custom", b"1")]
+            response = await main.proxy_backend_requests(_request("GET", "tasks", headers), "tasks")
+            await response.background()
+
+    asyncio.run(run())
+    assert seen_headers[0].get("connection") != "close"
+    assert "te" not in seen_headers[0]
+    assert "upgrade" not in seen_headers[0]
+    assert seen_headers[0]["x-custom"] == "1"
+
+
+def test_missing_frontend_directory_gives_404(tmp_path):
+    client = TestClient(main.FrontendStaticFiles(directory=tmp_path.joinpath("client"), html=True, check_dir=False))
+    for path in ("/", "/foo.js"):
+        response = client.get(path)
+        assert response.status_code == 404
+        assert response.content == b""
+
+
+def test_request_body_is_forwarded_only_when_declared(monkeypatch):
+    seen_requests = []
+
+    async def backend(request: httpx.Request) -> httpx.Response:
+        seen_requests.append((request.method, request.headers.get("transfer-encoding"), await request.aread()))
+        return httpx.Response(204)
+
+    monkeypatch.setattr(main.httpx, "AsyncHTTPTransport", lambda **_kwargs: httpx.MockTransport(backend))
+
+    async def run():
+        async with main.lifespan(main.APP):
+            for request in (
+                _request("DELETE", "tasks/1", []),
+                _request("POST", "tasks", [(b"content-length", b"2")], b"{}"),
+            ):
+                response = await main.proxy_backend_requests(request, request.url.path.removeprefix("/api/"))
+                await response.background()
+
+    asyncio.run(run())
+    assert seen_requests == [("DELETE", None, b""), ("POST", None, b"{}")]